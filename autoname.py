@@ -1,14 +1,60 @@
 # Autoname GUI and PSG testbed
 
-import string, os, sys, subprocess, threading
+import string, os, sys, subprocess, threading, copy, bisect, time, socket, asyncio, json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http import HTTPStatus
 from random import shuffle
 from glob import glob
 from configparser import ConfigParser
 # import PySimpleGUI as sg # deprecated now PSG has gone closed source
 import FreeSimpleGUI as sg
 
-_LOCS = {'SCAN_DIR' : '', 'OUTPUT_DIR' : '', 'WINRAR_PATH': ''} # filled in by config parser and .ini file
+_LOCS = {'SCAN_DIR' : '', 'OUTPUT_DIR' : '', 'WINRAR_PATH': '',
+         'AUTHOR_FILE': 'authors.txt', 'LIBRARY_FILE': 'library.txt'} # filled in by config parser and .ini file
+_RULE_ORDER = ['underscores', 'by', 'reverse', 'capitalize'] # auto-naming rules, can be set in the .ini file
+_POLICY = {'MAX_SIZE': 5000,         # KB, larger books can't be moved
+           'RAR_EXTS': ['.pdf'],     # formats that have to be compressed before moving
+           'BLOCK_WORDS': ['40k']}   # can't be left in a finished name, checked case-insensitively
 NUMBOXES = 5 # number of editing text boxes/segments used by the UI
+PREFETCH_COUNT = 3 # number of upcoming books to get ready in the background
+LEASE_SECS = 600 # how long a claim on a book lasts without being renewed
+RENEW_SECS = 60 # how often the main loop renews claims while waiting for input
+CLAIM_DIR = '.autoname-claims' # subdir of SCAN_DIR where instances sharing it leave their claims
+SCREEN_WORKERS = 8 # threads used to pre-screen the queue against the policy
+SERVICE_PORT = 8765 # default port for --serve, can be set in the .ini file
+SERVICE_WORKERS = 4 # service requests worked on at once, the rest wait their turn
+MAX_BATCH = 1000 # most names or renames accepted in one service request
+MAX_JOBS = 100 # finished rename jobs kept around for the service to report on
+
+# problem tags given to books by the policy checks
+TAG_RAR = 'needs RAR'
+TAG_LARGE = 'too large'
+TAG_WORDS = 'blocked word'
+TAG_BRACKETS = 'bad brackets'
+TAG_AUTHOR = 'unreversed author'
+ALL_TAGS = [TAG_RAR, TAG_LARGE, TAG_WORDS, TAG_BRACKETS, TAG_AUTHOR]
+
+_PREFETCH = {} # prefetched Book objects, keyed by file name
+_PREFETCH_PENDING = set() # file names currently being prefetched
+_PREFETCH_LOCK = threading.Lock()
+_PROPOSALS = {} # (suggested name, warnings) from the auto-naming rules, keyed by file name
+_PROPOSALS_PENDING = set() # file names queued for the proposer thread
+_PROPOSAL_LOCK = threading.Lock()
+_LIBRARY = {'names': None,    # file names in OUTPUT_DIR, set up by dir_loader
+            'mtime': 0,       # OUTPUT_DIR mtime the listing matches, 0 if it needs a rescan
+            'changed': False, # names have been added since the snapshot was written
+            'version': 0}     # bumped whenever names changes, so results from it can be checked
+_LIBRARY_LOCK = threading.Lock()
+_LIBRARY_RESCAN_LOCK = threading.Lock() # one rescan at a time, they all write the snapshot
+_LIBRARY_READY = threading.Event()
+_CLAIMS = {} # expiry times of this instance's claims, keyed by file name
+_CLAIM_LOCK = threading.Lock()
+_TAGS = {} # policy problem tags, keyed by file name
+_TAGS_PENDING = set() # file names queued for the screener
+_TAGS_LOCK = threading.Lock()
+_SERVICE = {'port': SERVICE_PORT, 'limit': None, 'jobs': {}, 'nextjob': 1, 'tasks': set()} # state for --serve
+_OWNER = f'{socket.gethostname()}:{os.getpid()}' # identifies this instance in claim files
 
 class Book:
     def __init__(self, filepath):
@@ -20,11 +66,20 @@ class Book:
             self.name = os.path.basename(splitname[0])  # just the book name, no ext
             self.ext = splitname[1].lower()             # the file extension, convert to lower for safety
             self.filename = self.name + self.ext        # name + file extension
+            self.sizeint = self.get_size_int()
             self.size = self.get_size_str()
-            self.seglist = [str.strip(x) for x in self.name.split(' - ')] # segment list
+            self.seglist = split_name(self.name)        # segment list
         else:
             self.filepath = self.name = self.ext = self.filename = self.size = ''
+            self.sizeint = None
             self.seglist = []
+        self.proposed = None    # auto-normalized name, filled in by the prefetcher or on demand
+        self.warnings = []      # problems the auto-naming rules couldn't fix
+        self.byauthor = False   # segment 0 is the author, because by_replace moved it there
+        self.authorguessed = False # segment 0 was reversed without knowing it's the author
+        self.authorchoices = [] # authority names segment 0 could have been, when there are several
+        self.dupes = None       # (search description, matches) tuple, filled in by the prefetcher
+        self.dupesversion = None # library version the dupe check was done against
 
     def __repr__(self):
         return self.filepath
@@ -66,7 +121,7 @@ class Book:
             return fsize
 
     def get_size_str(self):
-        fsize = self.get_size_int()
+        fsize = self.sizeint
         if fsize:
             return f'{fsize} KB' if fsize < 1024 else f'{round(fsize/1024, 2)} MB'
 
@@ -125,42 +180,106 @@ class Book:
                 beforeby, _, afterby = seg.partition(' by ')
                 self.seglist[x] = beforeby.strip(' ,-.')
                 self.seglist.insert(0, afterby.strip(' ,-.')) # this is probably author so move to front
+                self.byauthor = True
         self.reassemble_segs()
 
+    def author_reversed(self):
+        # sanity check for no comma in author's name
+        return ',' in self.seglist[0] or 'Various' in self.seglist[0]
+
+    def brackets_balanced(self):
+        return self.name.count('[') == self.name.count(']') and \
+               self.name.count('(') == self.name.count(')')
+
+    def author_mismatches(self):
+        # returns (name, canonical name) for authors written differently to the authority file
+        mismatches = []
+        for auth in split_authors(self.seglist[0]):
+            known = _AUTHORS.lookup(auth)
+            if known and known != auth:
+                mismatches.append((auth, known))
+        return mismatches
+
+    def name_warnings(self):
+        # the check_title checks, without asking the user anything
+        warnings = []
+        if not self.author_reversed():
+            warnings.append('author not reversed')
+        if self.authorguessed:
+            warnings.append('author guessed')
+        if self.authorchoices:
+            warnings.append('author could be ' + ' or '.join([f'"{x}"' for x in self.authorchoices]))
+        for auth, known in self.author_mismatches():
+            warnings.append(f'author is usually "{known}"')
+        if not self.brackets_balanced():
+            warnings.append("brackets don't match")
+        return warnings
+
     def check_title(self, window):
         # runs a couple of checks to catch basic naming errors
-        # sanity check for no comma in author's name
-        if ',' not in self.seglist[0] and 'Various' not in self.seglist[0]:
+        if not self.author_reversed():
             query = 'The author does not seem to have their name reversed.\n\nProceed anyway?\n'
             go = sg.PopupYesNo(query, title='Move file?')
             if go == 'No':
                 return False
-        if self.name.count('[') != self.name.count(']') or \
-           self.name.count('(') != self.name.count(')'):
+        for auth, known in self.author_mismatches():
+            query = f'"{auth}" is usually written as "{known}".\n\nProceed anyway?\n'
+            go = sg.PopupYesNo(query, title='Move file?')
+            if go == 'No':
+                return False
+        if not self.brackets_balanced():
             update_statustxt(window, "Rename stopped, brackets don't match.")
             return False
         return True
 
+    def blocked_words(self):
+        return [x for x in _POLICY['BLOCK_WORDS'] if x.lower() in self.name.lower()]
+
+    def policy_tags(self):
+        # checks the book against the policy, returning a list of problem tags.
+        # Uses the size from when the book was loaded, so doesn't touch the disk
+        tags = []
+        if self.ext in _POLICY['RAR_EXTS']:
+            tags.append(TAG_RAR)
+        if self.sizeint and self.sizeint > _POLICY['MAX_SIZE']:
+            tags.append(TAG_LARGE)
+        if self.blocked_words():
+            tags.append(TAG_WORDS)
+        if not self.brackets_balanced():
+            tags.append(TAG_BRACKETS)
+        if not self.author_reversed():
+            tags.append(TAG_AUTHOR)
+        return tags
+
     def finish(self, window, movebook=False):
         newname = _LOCS['OUTPUT_DIR'] + self.filename if movebook else _LOCS['SCAN_DIR'] + self.filename
 
         while '  ' in newname: #catch sneaky double spaces
             newname = newname.replace('  ', ' ')
 
-        if movebook and self.ext.lower() == '.pdf':
-            update_statustxt(window, 'Book is still in PDF format, move halted.')
-        elif '40k' in newname or '40K' in newname:
-            update_statustxt(window, '"40k" still in book name.')
-        elif movebook and self.get_size_int() > 5000:
-            update_statustxt(window, 'Book size is over 5MB, move halted.')
+        tags = self.policy_tags() # the bracket and author checks are left to check_title
+        if movebook and TAG_RAR in tags:
+            update_statustxt(window, f'Book is still in {self.ext[1:].upper()} format, move halted.')
+        elif TAG_WORDS in tags:
+            update_statustxt(window, f'"{self.blocked_words()[0]}" still in book name.')
+        elif movebook and TAG_LARGE in tags:
+            update_statustxt(window, f'Book size is over {size_limit_str()}, move halted.')
         else:
             if self.check_title(window):
+                bookname = os.path.basename(self.filepath)
+                if not claim_book(bookname):
+                    update_statustxt(window, f'Book is being worked on by {claim_owner(bookname)}, rename halted.')
+                    return
                 update_statustxt(window, f'Renaming book to {newname}.')
+                libmtime = dir_mtime(_LOCS['OUTPUT_DIR'])
                 try:
                     os.rename(self.filepath, newname)
                 except Exception as err:
                     update_statustxt(window, f'Error renaming book: {err}')
                 else:
+                    if movebook:
+                        library_add(os.path.basename(newname), libmtime)
+                    _AUTHORS.learn(split_authors(self.seglist[0]))
                     return True
 
     def delete(self, window):
@@ -168,6 +287,10 @@ class Book:
         text = f'About to delete {self.filepath}\n\nAre you sure?'
         check =  sg.PopupYesNo(text, title='Delete File?')
         if check == 'Yes':
+            bookname = os.path.basename(self.filepath)
+            if not claim_book(bookname):
+                update_statustxt(window, f'Book is being worked on by {claim_owner(bookname)}, delete halted.')
+                return
             update_statustxt(window, "Deleting file...")
             try:
                 os.remove(self.filepath)
@@ -178,40 +301,43 @@ class Book:
                 update_done_txt(window, True) # count a deleted book as done
                 return True
 
-    def dupefinder(self, window):
+    def find_dupes(self, seglist=None):
+        # works out the search keywords and returns (search description, list of matches)
+        # seglist can be given to search on a different version of the name, like a suggested one
+        seglist = seglist or self.seglist
         ignoredwords =  ['The', 'And', 'To', 'Of', 'By', 'With', 'We', 'As']
         #take author's name as first filter, search in subset
         transtable = str.maketrans('', '', ',.&()-[]0123456789')
         # QQQ should check for short auth name like de la Mare
-        auth = self.seglist[0].split()[0].translate(transtable) 
-        rarlist = [x for x in os.listdir(_LOCS['OUTPUT_DIR']) if x[-4:] == '.rar']
+        auth = seglist[0].split()[0].translate(transtable) 
+        rarlist = [x for x in library_names() if x[-4:] == '.rar']
         #rarlist = glob.glob(_LOCS['OUTPUT_DIR'] + '*.rar')
         # note that glob is not case sensitive
         booklist = [os.path.basename(x)[:-4] for x in rarlist if auth.lower() in x.lower()]
         #booklist = [os.path.basename(x)[:-4] for x in glob.glob(f'{_LOCS['OUTPUT_DIR']}\\*{auth.lower()}*.rar')]
         # if book name is only one segment, skip this and just search with author's name
-        if len(self.seglist) > 1:
+        if len(seglist) > 1:
             # otherwise get first word of title, adjusting for series name
-            if len(self.seglist) <= 2 or '[' not in self.seglist[1]\
-                or "A Very Short Introduction" in self.seglist:
+            if len(seglist) <= 2 or '[' not in seglist[1]\
+                or "A Very Short Introduction" in seglist:
                 # for book titles with 1 or 2 segments, like AAA, BBB - CCC
                 titlenum = 1
             else:
                 # for book titles with 3 or more segments, like Aaa, B - [GGG] - HHH - JJJ, get
                 # segment after the segment with ']' in it
-                for num, x in enumerate(self.seglist):
+                for num, x in enumerate(seglist):
                     if ']' in x:
                         titlenum = num + 1
                         break
                 else: #fall back to using last segment
-                    titlenum = len(self.seglist)- 1
+                    titlenum = len(seglist)- 1
 
-            title = [word for word in self.seglist[titlenum].split()\
+            title = [word for word in seglist[titlenum].split()\
                      if len(word) > 2 and word.capitalize() not in ignoredwords]
             if title:
                 title = title[0]
             else: # a title like '50 in 50' will cause title list to be empty, so make do with first bit anyway
-                title = self.seglist[titlenum].split()[0]
+                title = seglist[titlenum].split()[0]
             title = title.translate(transtable)
             if title:
                 srchstr = f'Searching on keywords "{auth}" and "{title}": '
@@ -222,7 +348,10 @@ class Book:
         else:
             srchstr = f'Searching for first word only ("{auth}") as no other keywords found.'
             result = booklist
+        return srchstr, result
 
+    def dupefinder(self, window):
+        srchstr, result = self.find_dupes()
         if result == []:
             update_statustxt(window, srchstr + 'no matches found.')
             #print("No matches found.")
@@ -265,22 +394,26 @@ class Book:
         if revname[-1] == '(ed)' or revname[-1] == '(ed.)':
             del revname[-1]
             edfound = True
-        if revname[-1] == 'Jr' or revname[-1] == 'Jr.':
-            del revname[-1]
-            jrfound = True
-        if 'and' in revname:
-            andloc = revname.index('and')
-        if 'with' in revname:
-            andloc = revname.index('with')
-        if 'With' in revname:
-            andloc = revname.index('With')
-        if 'and' not in revname or andloc == 1:
-            revname.insert(0, revname.pop())
-            revname = [x + '.' if len(x) == 1 else x for x in revname]
-            revstr = revname[0] + ', ' + ' '.join(revname[1:])
+        known = _AUTHORS.lookup(' '.join(revname)) # authority file beats guessing
+        if known:
+            revstr = known
         else:
-            revstr = self.format_name(' '.join(revname[:andloc])) + ' and ' \
-                     + self.format_name(' '.join(revname[andloc + 1:]))
+            if revname[-1] == 'Jr' or revname[-1] == 'Jr.':
+                del revname[-1]
+                jrfound = True
+            if 'and' in revname:
+                andloc = revname.index('and')
+            if 'with' in revname:
+                andloc = revname.index('with')
+            if 'With' in revname:
+                andloc = revname.index('With')
+            if 'and' not in revname or andloc == 1:
+                revname.insert(0, revname.pop())
+                revname = [x + '.' if len(x) == 1 else x for x in revname]
+                revstr = revname[0] + ', ' + ' '.join(revname[1:])
+            else:
+                revstr = self.format_name(' '.join(revname[:andloc])) + ' and ' \
+                         + self.format_name(' '.join(revname[andloc + 1:]))
 
         if edfound: 
             revstr += ' (ed.)'
@@ -290,6 +423,40 @@ class Book:
             revstr = revstr[:firstcomm] + ' Jr.' + revstr[firstcomm:]
         return revstr
 
+    def proposal(self):
+        # returns a copy of the book with the auto-naming rules applied, leaving this one untouched
+        newbook = copy.copy(self)
+        newbook.seglist = self.seglist[:]
+        for rule in _RULE_ORDER:
+            RULES[rule](newbook)
+        return newbook
+
+    def apply_proposal(self):
+        if self.proposed is None:
+            self.proposed, self.warnings = propose_book(os.path.basename(self.filepath))
+        self.seglist = split_name(self.proposed)
+        self.reassemble_segs()
+
+    def clear_underscores(self):
+        self.seglist = [' '.join(x.replace('_', ' ').split()) for x in self.seglist]
+        self.reassemble_segs()
+
+    def reverse_author(self):
+        # reverses the first segment if it hasn't been done yet. Unless the authority file knows
+        # the name or by_replace put it there, it may not even be the author, so flag it as a guess.
+        # If it's already reversed, just swaps in the authority file's form of the name if it has one
+        if len(self.seglist) > 1 and len(self.seglist[0].split()) > 1 and not self.author_reversed():
+            matches = _AUTHORS.matches(self.seglist[0])
+            if len(matches) > 1:
+                self.authorchoices = matches
+            elif not self.byauthor and not matches:
+                self.authorguessed = True
+            self.seglist[0] = self.format_name(self.seglist[0])
+        else:
+            for auth, known in self.author_mismatches():
+                self.seglist[0] = self.seglist[0].replace(auth, known)
+        self.reassemble_segs()
+
     def reverse_seg(self, window, segnum):
         if segnum >= len(self.seglist):
             update_statustxt(window, 'Attempt to reverse an out-of-bounds segment.')
@@ -344,6 +511,156 @@ class Book:
             self.reassemble_segs()
             display_currbook(window, False)
 
+# auto-naming rules, applied in the order given by _RULE_ORDER
+RULES = {'underscores': Book.clear_underscores,
+         'by': Book.by_replace,
+         'reverse': Book.reverse_author,
+         'capitalize': Book.capitalize}
+
+def size_limit_str():
+    return f'{round(_POLICY["MAX_SIZE"] / 1000, 1):g}MB'
+
+def split_name(name):
+    return [str.strip(x) for x in name.split(' - ')]
+
+def name_book(filename):
+    # a Book for a file name that doesn't have to exist, for working on names alone
+    book = Book('')
+    book.name, book.ext = os.path.splitext(filename)
+    book.ext = book.ext.lower()
+    book.filename = book.name + book.ext
+    book.seglist = split_name(book.name)
+    return book
+
+def split_authors(authseg):
+    # individual reversed author names from an author segment, like 'Aaa, B and Ccc, D (ed.)'
+    authseg = authseg.replace(' (ed.)', '').replace(' & ', ' and ')
+    return [x.strip() for x in authseg.split(' and ') if ',' in x and 'Various' not in x]
+
+def name_words(text):
+    return ' '.join(text.lower().replace('.', ' ').split())
+
+def author_key(name):
+    # (surname, given) for a reversed 'Surname, Given' name, ignoring case and full stops
+    if ',' not in name:
+        return None
+    surname, _, given = name.partition(',')
+    return name_words(surname), name_words(given)
+
+class AuthorIndex:
+    '''canonical author names, learned from finished books and the output library. Names are
+    kept in a sorted list so prefix lookups for autocomplete are a binary search, plus a dict
+    keyed on author_key for finding the canonical form of a name, reversed or not'''
+    def __init__(self):
+        self.names = []     # canonical names, sorted case-insensitively
+        self.lowered = []   # lowercase copies of self.names, for bisecting
+        self.bykey = {}     # author_key -> canonical name
+        self.changed = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self, filepath):
+        try:
+            with open(filepath, encoding='utf-8') as infile:
+                names = [x.strip() for x in infile if x.strip()]
+        except FileNotFoundError:
+            return
+        except Exception as err:
+            print(f'Error reading author file - {err}')
+            return
+        with self.lock:
+            self.names, self.lowered, self.bykey = [], [], {}
+            self._merge(names)
+            self.changed = False
+
+    def save(self, filepath):
+        with self.lock:
+            if not self.changed:
+                return
+            names = self.names[:]
+            self.changed = False
+        try:
+            with open(filepath, 'w', encoding='utf-8') as outfile:
+                outfile.write('\n'.join(names) + '\n')
+        except Exception as err:
+            print(f'Error saving author file - {err}')
+
+    def _merge(self, names):
+        # first form seen wins, so the file (and earlier finishes) take priority over later ones
+        added = False
+        for name in names:
+            key = author_key(name)
+            if key and key not in self.bykey:
+                self.bykey[key] = name
+                added = True
+        if added:
+            self.names = sorted(self.bykey.values(), key=str.lower)
+            self.lowered = [x.lower() for x in self.names]
+        return added
+
+    def learn(self, names):
+        with self.lock:
+            if not self._merge(names):
+                return False
+            self.changed = True
+        authors_changed()
+        return True
+
+    def matches(self, name):
+        # canonical names a name could be. A reversed name has to match exactly, but 'Given
+        # Surname' could split in more than one place, like 'Mary Ann Evans'
+        if ',' in name:
+            known = self.bykey.get(author_key(name))
+            return [known] if known else []
+        words = name_words(name).split()
+        keys = [(' '.join(words[x:]), ' '.join(words[:x])) for x in range(1, len(words))]
+        return [self.bykey[x] for x in keys if x in self.bykey]
+
+    def lookup(self, name):
+        # the canonical form of a name, or None if it's unknown or ambiguous
+        matches = self.matches(name)
+        return matches[0] if len(matches) == 1 else None
+
+    def complete(self, prefix, limit=5):
+        # canonical names starting with prefix, in alphabetical order
+        prefix = prefix.lower()
+        with self.lock:
+            start = bisect.bisect_left(self.lowered, prefix)
+            matches = []
+            for x in range(start, min(start + limit, len(self.names))):
+                if not self.lowered[x].startswith(prefix):
+                    break
+                matches.append(self.names[x])
+        return matches
+
+_AUTHORS = AuthorIndex()
+
+LIBRARY_MAGIC = 'autoname-library-1'
+
+def read_snapshot(filepath):
+    # returns (dir mtime, file names) from a library snapshot, or (None, []) if there isn't one
+    try:
+        with open(filepath, encoding='utf-8', errors='surrogateescape') as infile:
+            lines = infile.read().split('\n')
+        magic, mtime = lines[0].split(' ')
+        if magic != LIBRARY_MAGIC:
+            raise ValueError('not a library snapshot')
+        return int(mtime), [x for x in lines[1:] if x]
+    except FileNotFoundError:
+        return None, []
+    except Exception as err:
+        print(f'Error reading library snapshot - {err}')
+        return None, []
+
+def write_snapshot(filepath, filenames, mtime):
+    # a header line with the dir mtime the listing matches, then a file name per line
+    tmppath = filepath + '.tmp'
+    with open(tmppath, 'w', encoding='utf-8', errors='surrogateescape') as outfile:
+        outfile.write(f'{LIBRARY_MAGIC} {mtime}\n' + '\n'.join(filenames) + '\n')
+    os.replace(tmppath, filepath) # so a half-written snapshot is never picked up
+
 # ----------------------------------------------------------------------------------------
 
 def generate_seg_layout(num):
@@ -380,12 +697,15 @@ def layout_window(booklist):
     sortframe = [[sg.Radio('New', 'radsort', enable_events=True, key='radnew', default=True),
                   sg.Radio('Old', 'radsort', enable_events=True, key='radold'),
                   sg.Radio('Random', 'radsort', enable_events=True, key='radrand'),
-                  sg.Radio('Alpha', 'radsort', enable_events=True, key='radalpha')]]
+                  sg.Radio('Alpha', 'radsort', enable_events=True, key='radalpha'),
+                  sg.Radio('Tags', 'radsort', enable_events=True, key='radtags')]]
 
     listcol = [[sg.Listbox(values=booklist, enable_events=True, size=(50, 8), key='filelist')],
                [sg.Frame('Sort By', sortframe),
-                sg.Checkbox('Show Large (>5MB)', default=True, pad=((10, 2), (22, 2)),
-                             enable_events=True, key='chklarge')]]
+                sg.Checkbox(f'Show Large (>{size_limit_str()})', default=True, pad=((10, 2), (22, 2)),
+                             enable_events=True, key='chklarge')],
+               [sg.Text('Show:'), sg.Combo(['All books', 'No problems'] + ALL_TAGS, default_value='All books',
+                                           readonly=True, enable_events=True, size=(18, 1), key='cmbtag')]]
 
     layout = [[sg.Frame('Current Book', [[sg.Text('No book currently selected.', size=(86, 1), key='fullname')]]),
                sg.Frame('Size', [[sg.Text('--', size=(8, 1), justification='center', key='txtsize')]]),
@@ -439,8 +759,9 @@ def update_textboxes(window, seglist):
             toggle_seg_vis(window, x, False)
 
 def update_filelist(window, event, values):
-    radiolist = ['radnew', 'radrand', 'radold', 'radalpha']
+    radiolist = ['radnew', 'radrand', 'radold', 'radalpha', 'radtags']
     showlarge = window['chklarge'].Get()
+    showtag = window['cmbtag'].Get()
 
     if values and event not in radiolist:
         #different event triggered filelist update, like a rename, so get current sort setting
@@ -450,23 +771,36 @@ def update_filelist(window, event, values):
                 break
 
     if event == 'radnew':
-        booklist = gen_booklist('newestfirst', showlarge)
+        booklist = gen_booklist('newestfirst', showlarge, showtag)
     elif event == 'radrand':
-        booklist = gen_booklist('random', showlarge)
+        booklist = gen_booklist('random', showlarge, showtag)
     elif event == 'radold':
-        booklist = gen_booklist('oldestfirst', showlarge)
+        booklist = gen_booklist('oldestfirst', showlarge, showtag)
     elif event == 'radalpha':
-        booklist = gen_booklist('alphabetical', showlarge)
+        booklist = gen_booklist('alphabetical', showlarge, showtag)
+    elif event == 'radtags':
+        booklist = gen_booklist('tags', showlarge, showtag)
 
     window['filelist'].Update(values=booklist, set_to_index=0)
     ab = window['filelist'].GetListValues()
+    start_proposer(booklist)
+    start_screener(booklist)
     if ab != []:
-        process_events.currbook = Book(_LOCS['SCAN_DIR'] + ab[0])
+        process_events.currbook = get_book(ab[0])
+        process_events.currindex = 0
         display_currbook(window)
         process_events.done[1] = len(booklist)
         update_done_txt(window)
         return booklist
-    else:
+    else: # nothing left, or nothing matching the filter
+        process_events.currbook = None
+        process_events.currindex = 0
+        process_events.done[1] = 0
+        update_done_txt(window)
+        window['fullname'].Update('No book currently selected.')
+        window['txtsize'].Update('--', text_color='white')
+        update_textboxes(window, [])
+        display_currbook(window)
         return None
 
 def show_help():
@@ -478,6 +812,10 @@ def show_help():
     '\n• XY: Swap positions of segments X and Y.' \
     '\n• splX: split segment X, defaults to first segment.' \
     '\n• by: Remove "by" and split segment.' \
+    '\n• p: Apply the suggested name.' \
+    '\n• pl: List suggested names for all books.' \
+    '\n• pa: Accept all suggested names that have no warnings.' \
+    '\n• aX: Use author suggestion X, defaults to first suggestion.' \
     '\n• o: Open current file.' \
     '\n• rar: Compress current file.' \
     '\n• fd: Find duplicates of file in target directory.' \
@@ -496,7 +834,7 @@ def show_help():
     '\n• q: Quit.'
     sg.PopupOK(helptext, title='Help')
 
-def gen_booklist(mode='newestfirst', showlarge=True):
+def gen_booklist(mode='newestfirst', showlarge=True, showtag='All books'):
     fdict = {}
     filelist = []
 
@@ -504,12 +842,23 @@ def gen_booklist(mode='newestfirst', showlarge=True):
                 glob(_LOCS['SCAN_DIR'] + '*.txt'):
         if showlarge == False:
             size =  os.path.getsize(book)
-            if size > 5000000:
+            if size > _POLICY['MAX_SIZE'] * 1024:
                 continue
         fdict[book] = os.path.getmtime(book)
 
+    others = claimed_by_others([os.path.basename(x) for x in fdict])
     for book, date in sorted(iter(fdict.items()), key=lambda x: x[1], reverse=(mode=='newestfirst')):
-        filelist.append(os.path.basename(book))
+        if os.path.basename(book) not in others: # leave books other people are working on
+            filelist.append(os.path.basename(book))
+
+    if mode == 'tags' or showtag != 'All books':
+        tags = screen_books(filelist) # waits for any books the screener hasn't got to yet
+        if showtag == 'No problems':
+            filelist = [x for x in filelist if not tags[x]]
+        elif showtag != 'All books':
+            filelist = [x for x in filelist if showtag in tags[x]]
+        if mode == 'tags': # group books with the same problems together, worst first
+            filelist = sorted(filelist, key=lambda x: (-len(tags[x]), tags[x]))
 
     if mode == 'random':
         shuffle(filelist)
@@ -529,6 +878,7 @@ def move_to_next_book(window, lastbook=None):
     #lastbook is 'delete', 'revert' or 'retain'
     #Finish/Move uses delete, Finish uses retain, moving onwards normally uses revert
     allbooks = window['filelist'].GetListValues()
+    process_events.completions = [] # author suggestions were for the last book
     if lastbook == 'delete': # delete old book entry and reload list, then highlist next book
         del allbooks[process_events.currindex]
     elif lastbook == 'retain':
@@ -539,23 +889,88 @@ def move_to_next_book(window, lastbook=None):
             #allbooks
         process_events.currindex += 1
 
+    skip_claimed(allbooks)
     window['filelist'].Update(values=allbooks, set_to_index=process_events.currindex,
                               scroll_to_index=process_events.currindex)
-    if process_events.currindex >= len(allbooks):
-        process_events.currindex = len(allbooks) - 1
     if allbooks:
         newbook = allbooks[process_events.currindex]
-        process_events.currbook = Book(_LOCS['SCAN_DIR'] + newbook)
+        process_events.currbook = get_book(newbook)
+        show_book_hints(window)
     else: #empty list as no books are left
         process_events.currindex = 0
         process_events.currbook = None
 
+def skip_claimed(allbooks):
+    '''claims the book at currindex, dropping any books another instance has claimed since the
+    list was made and moving on to the next one. Returns True if any books were dropped'''
+    skipped = False
+    while allbooks:
+        process_events.currindex = min(process_events.currindex, len(allbooks) - 1)
+        if claim_book(allbooks[process_events.currindex]):
+            break
+        del allbooks[process_events.currindex]
+        skipped = True
+    return skipped
+
+def claim_current(window):
+    # makes sure this instance holds the current book, switching to the next free one if not
+    allbooks = window['filelist'].GetListValues()
+    if not skip_claimed(allbooks):
+        return
+    window['filelist'].Update(values=allbooks, set_to_index=process_events.currindex,
+                              scroll_to_index=process_events.currindex)
+    process_events.completions = []
+    if allbooks:
+        process_events.currbook = get_book(allbooks[process_events.currindex])
+        update_statustxt(window, 'Skipped books that someone else is working on.')
+    else:
+        process_events.currindex = 0
+        process_events.currbook = None
+
 def move_to_specified_book(window, bookname):
     allbooks = window['filelist'].GetListValues()
     bookpos = allbooks.index(bookname)
     process_events.currindex = bookpos
+    process_events.completions = []
     window['filelist'].Update(set_to_index=bookpos, scroll_to_index=bookpos)
-    process_events.currbook = Book(_LOCS['SCAN_DIR'] + bookname)
+    process_events.currbook = get_book(bookname)
+    show_book_hints(window)
+
+def get_book(bookname):
+    # hands over the prefetched copy of a book if there is one, otherwise builds it now
+    with _PREFETCH_LOCK:
+        book = _PREFETCH.pop(bookname, None)
+    if not book:
+        return Book(_LOCS['SCAN_DIR'] + bookname)
+    proposed, warnings = propose_book(bookname) # in case the author file has learned since
+    if proposed != book.proposed:
+        book.proposed, book.warnings = proposed, warnings
+        book.dupesversion = None
+    else:
+        book.warnings = warnings
+    if book.dupes is not None and book.dupesversion != library_version():
+        # books have gone into the library since, quite possibly a copy of this one
+        book.dupesversion = library_version()
+        book.dupes = book.find_dupes(split_name(book.proposed))
+    return book
+
+def show_book_hints(window):
+    # shows the suggested name and dupe check results worked out by the prefetcher
+    book = process_events.currbook
+    if book.proposed is None or book.dupes is None:
+        return
+    hints = f'Suggested: {book.proposed}' if book.proposed != book.name else 'No name changes suggested.'
+    if book.warnings:
+        hints += f' ({", ".join(book.warnings)})'
+    tags = [x for x in book.policy_tags() if x in (TAG_RAR, TAG_LARGE)] # the rest are name problems
+    if tags:
+        hints += f' Also {" and ".join(tags)}.'
+    srchstr, result = book.dupes
+    if result:
+        hints += '\nPossible dupes: ' + '; '.join(result)
+    else:
+        hints += '\nNo dupes found.'
+    update_statustxt(window, hints)
 
 def process_txt_cmd(window, values, cmd):
     update_cmdbox(window)
@@ -570,6 +985,13 @@ def process_txt_cmd(window, values, cmd):
         process_events.currbook.dupefinder(window)
     elif cmd == 'by':
         process_events.currbook.by_replace()
+    elif cmd == 'p': # apply suggested name
+        process_events.currbook.apply_proposal()
+    elif cmd == 'pl': # list suggested names
+        show_proposals(window)
+    elif cmd == 'pa': # accept suggested names in bulk
+        if accept_proposals(window):
+            update_filelist(window, None, values)
     elif cmd == 'rar':
         newbook = process_events.currbook.rar(window)
         if newbook: #update listbox filename too
@@ -606,6 +1028,14 @@ def process_txt_cmd(window, values, cmd):
             move_to_next_book(window, 'retain')
     elif cmd == 'as': # add a new segment
         process_events.currbook.add_seg()
+    elif cmd == 'a' or (cmd[0] == 'a' and cmd[1:].isdigit()): # use an author autocomplete suggestion
+        choice = int(cmd[1:]) - 1 if len(cmd) > 1 else 0
+        if 0 <= choice < len(process_events.completions):
+            process_events.currbook.edit_seg(0, process_events.completions[choice])
+        elif process_events.completions:
+            update_statustxt(window, f'There are only {len(process_events.completions)} author suggestions.')
+        else:
+            update_statustxt(window, 'No author suggestions to use, start typing in the Author(s) box.')
     elif cmd == '40k': # Ave Imperator!
         process_events.currbook.add_seg('[Warhammer 40,000', 1)
     elif cmd == 'ssc': #short story collection designator
@@ -659,13 +1089,20 @@ def process_events(window, event, values):
     txtboxes = ['txt' + str(x) for x in range(1, NUMBOXES+1)] # doing this every time doesn't seem efficient
     acceptletts = string.ascii_letters + string.digits + " []()-&,.;'"
 
-    if not process_events.currbook and event != 'Help': # no books so disable all buttons except Help
-        return
+    listevents = ['chklarge', 'cmbtag', 'radold', 'radnew', 'radalpha', 'radrand', 'radtags']
+    if not process_events.currbook and event != 'Help' and event not in listevents:
+        return # no books so disable all buttons except Help and the file list options
 
     if event == 'filelist': #update the file list window
         listedbookname = values['filelist'][0]
-        process_events.currbook = Book(_LOCS['SCAN_DIR'] + listedbookname)
-        process_events.currindex = window['filelist'].Widget.curselection()[0]
+        if claim_book(listedbookname):
+            process_events.currbook = get_book(listedbookname)
+            process_events.currindex = window['filelist'].Widget.curselection()[0]
+            process_events.completions = []
+            show_book_hints(window)
+        else:
+            update_statustxt(window, f'{listedbookname} is being worked on by {claim_owner(listedbookname)}.')
+            window['filelist'].Update(set_to_index=process_events.currindex)
     elif event == 'btngo': # a text command is to be executed
         cmd = window['txtcmd'].Get()
         try:
@@ -705,12 +1142,12 @@ def process_events(window, event, values):
         res = process_events.currbook.delete(window)
         if res:
             move_to_next_book(window, 'delete')
-    elif event == 'chklarge':
+    elif event in ['chklarge', 'cmbtag']: # file list filters
         update_filelist(window, event, values)
     elif 'delseg' in event: # one of the individual delete segment buttons
         getsegnum = int(event[-1])
         process_events.currbook.del_seg(window, getsegnum)
-    elif event in ['radold', 'radnew', 'radalpha', 'radrand']: # file list sort options
+    elif event in ['radold', 'radnew', 'radalpha', 'radrand', 'radtags']: # file list sort options
         update_filelist(window, event, values)
     elif event in txtboxes: # rebuild filename with edited text
         for num, x in enumerate(process_events.currbook.seglist):
@@ -723,19 +1160,29 @@ def process_events(window, event, values):
                     process_events.currbook.edit_seg(num, txtboxdata)
             else:
                 update_statustxt(window, 'Error renaming book: invalid key.')
+        if event == 'txt1':
+            show_author_completions(window, process_events.currbook.seglist[0])
 
     # if editing a text box, don't want focus to snap back to cmd txtbox
     display_currbook(window, values, event not in txtboxes)
 
+def show_author_completions(window, prefix):
+    process_events.completions = _AUTHORS.complete(prefix) if len(prefix) > 1 else []
+    if process_events.completions:
+        update_statustxt(window, 'Authors: ' + '   '.join([f'{num}. {x}' for num, x in
+                                 enumerate(process_events.completions, 1)]) + '   (aX to use)')
+
 def display_currbook(window, values=None, resetfocus=True):
     #takes care of displaying current book's details at the top
+    if process_events.currbook:
+        claim_current(window)
     currbook = process_events.currbook
     if currbook:
         window['fullname'].Update(f'{currbook.filename}') # ({currbook.size})
 
         booksize = currbook.get_size_int()
         if booksize:
-            txtcol = 'white' if booksize < 5000 else 'red'
+            txtcol = 'white' if booksize < _POLICY['MAX_SIZE'] else 'red'
             window['txtsize'].Update(f'{currbook.size}', text_color=txtcol)
         else:
             update_statustxt(window, 'Selected book has been moved, deleted or renamed.'\
@@ -745,6 +1192,9 @@ def display_currbook(window, values=None, resetfocus=True):
         update_textboxes(window, currbook.seglist)
         if resetfocus:
             window['txtcmd'].SetFocus()
+        start_prefetch(window)
+    elif window['cmbtag'].Get() != 'All books':
+        update_statustxt(window, 'No books match the current filter.')
     else:
         update_statustxt(window, f'No books found in current working directory ({_LOCS["SCAN_DIR"]}).')
 
@@ -755,25 +1205,646 @@ def load_config():
         _LOCS['SCAN_DIR'] = config['Locations']['scandir']
         _LOCS['OUTPUT_DIR'] = config['Locations']['outputdir']
         _LOCS['WINRAR_PATH'] = config['Locations']['winrarpath']
+        _LOCS['AUTHOR_FILE'] = config['Locations'].get('authorfile', _LOCS['AUTHOR_FILE'])
+        _LOCS['LIBRARY_FILE'] = config['Locations'].get('libraryfile', _LOCS['LIBRARY_FILE'])
+        if config.has_option('Service', 'port'):
+            _SERVICE['port'] = config['Service'].getint('port')
+        if config.has_section('Policy'):
+            policy = config['Policy']
+            _POLICY['MAX_SIZE'] = policy.getint('maxsize', _POLICY['MAX_SIZE'])
+            if 'rarexts' in policy:
+                _POLICY['RAR_EXTS'] = [x.strip().lower() for x in policy['rarexts'].split(',') if x.strip()]
+            if 'blockwords' in policy:
+                _POLICY['BLOCK_WORDS'] = [x.strip() for x in policy['blockwords'].split(',') if x.strip()]
+        if config.has_option('Rules', 'order'):
+            rules = [x.strip() for x in config['Rules']['order'].split(',') if x.strip()]
+            for rule in rules:
+                if rule not in RULES:
+                    raise ValueError(f'unknown naming rule "{rule}"')
+            _RULE_ORDER[:] = rules
         return True
     except Exception as err:
         print(f'Error reading or parsing config file - {err}')
         return False
 
+def dir_mtime(dirpath):
+    try:
+        return os.stat(dirpath).st_mtime_ns
+    except Exception:
+        return 0
+
+def load_library():
+    '''uses the library snapshot if the output dir hasn't changed since it was saved, otherwise
+    lists the dir the slow way and saves a new one. Returns the names that weren't in the last
+    snapshot, which are the only ones with anything new to learn from'''
+    mtime = dir_mtime(_LOCS['OUTPUT_DIR'])
+    snapmtime, filenames = read_snapshot(_LOCS['LIBRARY_FILE'])
+    if mtime and snapmtime == mtime:
+        newnames = []
+    else:
+        oldnames = set(filenames)
+        filenames = os.listdir(_LOCS['OUTPUT_DIR'])
+        newnames = [x for x in filenames if x not in oldnames]
+        try:
+            write_snapshot(_LOCS['LIBRARY_FILE'], filenames, mtime)
+        except Exception as err:
+            print(f'Error saving library snapshot - {err}')
+    with _LIBRARY_LOCK:
+        _LIBRARY.update(names=filenames, mtime=mtime, changed=False, version=_LIBRARY['version'] + 1)
+    return newnames
+
+def refresh_library():
+    # picks up books that anything else has moved into OUTPUT_DIR since it was listed
+    with _LIBRARY_RESCAN_LOCK:
+        mtime = dir_mtime(_LOCS['OUTPUT_DIR'])
+        if not mtime or mtime == _LIBRARY['mtime']:
+            return
+        learn_library_authors(load_library())
+
+def library_names():
+    # every file name in OUTPUT_DIR, waiting for the preloader if it's still going
+    _LIBRARY_READY.wait()
+    try:
+        refresh_library()
+    except Exception as err:
+        print(f'Error refreshing library - {err}')
+    with _LIBRARY_LOCK:
+        if _LIBRARY['names'] is None: # preloader failed, so fall back to listing the dir
+            return os.listdir(_LOCS['OUTPUT_DIR'])
+        return _LIBRARY['names']
+
+def library_version():
+    # changes whenever the listing does, including from outside changes to OUTPUT_DIR
+    library_names()
+    return _LIBRARY['version']
+
+def library_add(filename, mtime_before):
+    '''patches the listing after a book is moved into OUTPUT_DIR, so neither this session nor
+    the next startup has to rescan. mtime_before is the dir mtime from just before the move -
+    if it doesn't match then something else has changed the dir too, so leave it to a rescan'''
+    _LIBRARY_READY.wait()
+    with _LIBRARY_LOCK:
+        if _LIBRARY['names'] is None:
+            return
+        if filename not in _LIBRARY['names']:
+            _LIBRARY['names'].append(filename)
+            _LIBRARY['version'] += 1
+        if _LIBRARY['mtime'] and _LIBRARY['mtime'] == mtime_before:
+            _LIBRARY['mtime'] = dir_mtime(_LOCS['OUTPUT_DIR'])
+            _LIBRARY['changed'] = True
+        else:
+            _LIBRARY['mtime'] = 0
+
+def save_library():
+    with _LIBRARY_LOCK:
+        if not _LIBRARY['changed'] or not _LIBRARY['mtime']:
+            return
+        try:
+            write_snapshot(_LOCS['LIBRARY_FILE'], _LIBRARY['names'], _LIBRARY['mtime'])
+        except Exception as err:
+            print(f'Error saving library snapshot - {err}')
+        _LIBRARY['changed'] = False
+
+def learn_library_authors(filenames):
+    authors = []
+    for x in filenames:
+        if x[-4:] == '.rar':
+            authors.extend(split_authors(x.split(' - ')[0]))
+    if _AUTHORS.learn(authors):
+        _AUTHORS.save(_LOCS['AUTHOR_FILE'])
+
 def dir_loader():
-    load_dir = os.listdir(_LOCS['OUTPUT_DIR'])
+    newnames = []
+    try:
+        with _LIBRARY_RESCAN_LOCK:
+            newnames = load_library()
+    except Exception as err:
+        print(f'Error loading library - {err}')
+    finally:
+        _LIBRARY_READY.set()
+    if not len(_AUTHORS): # no author file yet, so learn from the whole library
+        newnames = _LIBRARY['names'] or []
+    learn_library_authors(newnames)
 
 def start_preloader():
     '''a major problem has been that the dupefinder function hangs for ~30 secs because
     of the slowness of scanning a dir with ~20K files on an old laptop. This function spins 
-    off a thread to do that and thus force the OS to cache results on program startup, speeding 
-    all future uses of the dupefinder'''
-    t = threading.Thread(target=dir_loader)
+    off a thread to load the library listing on program startup, from the saved snapshot if
+    the dir hasn't changed. After that the dupefinder only rescans the dir if it changes'''
+    t = threading.Thread(target=dir_loader, daemon=True)
     t.start()
 
+def prefetch_books(booknames):
+    # runs in a background thread, so must not touch the window
+    for bookname in booknames:
+        try:
+            if not claim_book(bookname): # someone else has it, moving on will skip it
+                continue
+            book = Book(_LOCS['SCAN_DIR'] + bookname)
+            book.proposed, book.warnings = propose_book(bookname)
+            book.dupesversion = library_version()
+            book.dupes = book.find_dupes(split_name(book.proposed))
+        except Exception as err:
+            print(f'Error prefetching {bookname} - {err}')
+        else:
+            with _PREFETCH_LOCK:
+                _PREFETCH[bookname] = book
+        finally:
+            with _PREFETCH_LOCK:
+                _PREFETCH_PENDING.discard(bookname)
+
+def start_prefetch(window):
+    '''keeps the next few books in list order ready in the background - stat info, suggested
+    name and dupe check - so moving on to the next book doesn't have to wait for any of them'''
+    allbooks = window['filelist'].GetListValues()
+    upcoming = allbooks[process_events.currindex + 1:process_events.currindex + 1 + PREFETCH_COUNT]
+    current = allbooks[process_events.currindex:process_events.currindex + 1]
+    release_claims(set(current + upcoming)) # display_currbook has already claimed the current one
+    renew_claims()
+    with _PREFETCH_LOCK:
+        for bookname in list(_PREFETCH): # drop anything no longer coming up
+            if bookname not in upcoming:
+                del _PREFETCH[bookname]
+        todo = [x for x in upcoming if x not in _PREFETCH and x not in _PREFETCH_PENDING]
+        _PREFETCH_PENDING.update(todo)
+    if todo:
+        t = threading.Thread(target=prefetch_books, args=(todo,), daemon=True)
+        t.start()
+
+def propose_book(bookname):
+    # returns the cached (suggested name, warnings) for a book, working it out if needed
+    with _PROPOSAL_LOCK:
+        if bookname in _PROPOSALS:
+            return _PROPOSALS[bookname]
+    proposal = Book(_LOCS['SCAN_DIR'] + bookname).proposal()
+    result = (proposal.name, proposal.name_warnings())
+    with _PROPOSAL_LOCK:
+        _PROPOSALS[bookname] = result
+    return result
+
+def run_proposer(booknames):
+    # runs in a background thread, so must not touch the window
+    for bookname in booknames:
+        try:
+            propose_book(bookname)
+        except Exception as err:
+            print(f'Error proposing name for {bookname} - {err}')
+        finally:
+            with _PROPOSAL_LOCK:
+                _PROPOSALS_PENDING.discard(bookname)
+
+def authors_changed():
+    # cached suggestions may have guessed at names the author file now knows, so redo them
+    normalize_name.cache_clear()
+    with _PROPOSAL_LOCK:
+        stale = list(_PROPOSALS)
+        _PROPOSALS.clear()
+    start_proposer(stale)
+
+def start_proposer(booklist):
+    '''works out suggested names for the whole queue in the background, so that the
+    straightforward ones can be reviewed and accepted in one go'''
+    with _PROPOSAL_LOCK:
+        todo = [x for x in booklist if x not in _PROPOSALS and x not in _PROPOSALS_PENDING]
+        _PROPOSALS_PENDING.update(todo)
+    if todo:
+        t = threading.Thread(target=run_proposer, args=(todo,), daemon=True)
+        t.start()
+
+def get_proposals(booklist):
+    # returns (book name, new file name, warnings) for listed books the rules would change
+    changes = []
+    with _PROPOSAL_LOCK:
+        for bookname in booklist:
+            if bookname in _PROPOSALS:
+                proposed, warnings = _PROPOSALS[bookname]
+                newname = proposed + os.path.splitext(bookname)[1].lower()
+                while '  ' in newname:
+                    newname = newname.replace('  ', ' ')
+                if newname != bookname:
+                    changes.append((bookname, newname, warnings))
+    return changes
+
+def show_proposals(window):
+    allbooks = window['filelist'].GetListValues()
+    changes = get_proposals(allbooks)
+    with _PROPOSAL_LOCK:
+        pending = len(_PROPOSALS_PENDING)
+    if not changes:
+        update_statustxt(window, 'No suggested name changes' + (' yet.' if pending else '.'))
+        return
+    outtext = f'{len(changes)} suggested name changes'
+    outtext += f' ({pending} books still being checked):\n' if pending else ':\n'
+    for bookname, newname, warnings in changes:
+        outtext += f'\n• {bookname}\n    → {newname}'
+        if warnings:
+            outtext += f'  [{", ".join(warnings)}]'
+    sg.PopupScrolled(outtext, title='Suggested Names', size=(90, 20))
+
+def accept_proposals(window):
+    # renames every listed book with a warning-free suggestion, leaving them in SCAN_DIR
+    allbooks = window['filelist'].GetListValues()
+    changes = [x for x in get_proposals(allbooks) if not x[2]]
+    if not changes:
+        update_statustxt(window, 'No suggested names ready to accept.')
+        return False
+    query = f'About to rename {len(changes)} books to their suggested names.\n\nProceed?'
+    if sg.PopupYesNo(query, title='Accept suggestions?') != 'Yes':
+        return False
+
+    held = set(_CLAIMS) # the current and upcoming books, which stay claimed
+    renamed = failed = 0
+    for bookname, newname, _ in changes:
+        # a case-only rename 'exists' already on case-insensitive drives
+        clash = newname.lower() != bookname.lower() and os.path.exists(_LOCS['SCAN_DIR'] + newname)
+        if clash or not claim_book(bookname):
+            failed += 1
+            continue
+        try:
+            os.rename(_LOCS['SCAN_DIR'] + bookname, _LOCS['SCAN_DIR'] + newname)
+        except Exception as err:
+            print(f'Error renaming {bookname} - {err}')
+            failed += 1
+        else:
+            renamed += 1
+    release_claims(held)
+    update_statustxt(window, f'Renamed {renamed} books to their suggested names.' +
+                             (f' {failed} could not be renamed.' if failed else ''))
+    return True
+
+def screen_book(bookname):
+    tags = Book(_LOCS['SCAN_DIR'] + bookname).policy_tags()
+    with _TAGS_LOCK:
+        _TAGS[bookname] = tags
+    return tags
+
+def screen_books(booknames):
+    '''checks books against the policy in parallel (mostly waiting on file stats, so threads
+    are fine), returning {book name: tags}. Books already screened come from the cache'''
+    with _TAGS_LOCK:
+        tags = {x: _TAGS[x] for x in booknames if x in _TAGS}
+    todo = [x for x in booknames if x not in tags]
+    if todo:
+        with ThreadPoolExecutor(max_workers=SCREEN_WORKERS) as pool:
+            for bookname, booktags in zip(todo, pool.map(screen_book, todo)):
+                tags[bookname] = booktags
+    return tags
+
+def run_screener(booknames):
+    # runs in a background thread, so must not touch the window
+    try:
+        screen_books(booknames)
+    except Exception as err:
+        print(f'Error screening books - {err}')
+    finally:
+        with _TAGS_LOCK:
+            _TAGS_PENDING.difference_update(booknames)
+
+def start_screener(booklist):
+    # pre-screens the whole queue in the background so sorting and filtering by tag is quick
+    with _TAGS_LOCK:
+        todo = [x for x in booklist if x not in _TAGS and x not in _TAGS_PENDING]
+        _TAGS_PENDING.update(todo)
+    if todo:
+        t = threading.Thread(target=run_screener, args=(todo,), daemon=True)
+        t.start()
+
+def claim_path(bookname):
+    return os.path.join(_LOCS['SCAN_DIR'], CLAIM_DIR, bookname + '.claim')
+
+def read_claim(path):
+    '''returns (owner, expiry time) from a claim file, or (None, 0) if there isn't one. A file
+    that can't be read, like one left empty by a crash, belongs to an unknown owner and expires
+    LEASE_SECS after it was last written, so it can be taken over rather than locking the book'''
+    try:
+        with open(path, encoding='utf-8') as infile:
+            owner, expiry = infile.read().split('\n')[:2]
+        return owner, float(expiry)
+    except FileNotFoundError:
+        return None, 0
+    except Exception:
+        try:
+            return 'unknown', os.path.getmtime(path) + LEASE_SECS
+        except OSError:
+            return None, 0
+
+def claim_owner(bookname):
+    return read_claim(claim_path(bookname))[0] or 'nobody'
+
+def claim_book(bookname):
+    '''claims a book for this instance by leaving a claim file with an expiry time in the
+    shared SCAN_DIR, so other instances working on the same folder leave it alone. Returns
+    False if another instance has a live claim on it. Claims are only rewritten once they're
+    half expired, so this is cheap to call repeatedly'''
+    now = time.time()
+    with _CLAIM_LOCK:
+        if _CLAIMS.get(bookname, 0) - now > LEASE_SECS / 2:
+            return True
+    path = claim_path(bookname)
+    owner, expiry = read_claim(path)
+    if owner and owner != _OWNER and expiry > now:
+        return False
+
+    claimtext = f'{_OWNER}\n{now + LEASE_SECS}\n'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if owner is None: # create it exclusively, in case another instance is doing the same
+            with open(path, 'x', encoding='utf-8') as outfile:
+                outfile.write(claimtext)
+        else: # ours to renew, or an expired one to take over
+            with open(path + '.tmp', 'w', encoding='utf-8') as outfile:
+                outfile.write(claimtext)
+            os.replace(path + '.tmp', path)
+    except FileExistsError:
+        return False
+    except Exception as err:
+        # not being able to write claims shouldn't stop a lone user working
+        print(f'Error claiming {bookname} - {err}')
+    else:
+        if read_claim(path)[0] != _OWNER: # lost a race to take over an expired claim
+            return False
+    with _CLAIM_LOCK:
+        _CLAIMS[bookname] = now + LEASE_SECS
+    return True
+
+def release_claim(bookname):
+    with _CLAIM_LOCK:
+        _CLAIMS.pop(bookname, None)
+    path = claim_path(bookname)
+    if read_claim(path)[0] == _OWNER:
+        try:
+            os.remove(path)
+        except Exception as err:
+            print(f'Error releasing claim on {bookname} - {err}')
+
+def release_claims(keep=()):
+    # gives up this instance's claims on everything not in keep
+    with _CLAIM_LOCK:
+        released = [x for x in _CLAIMS if x not in keep]
+    for bookname in released:
+        release_claim(bookname)
+
+def renew_claims():
+    with _CLAIM_LOCK:
+        booknames = list(_CLAIMS)
+    for bookname in booknames:
+        claim_book(bookname)
+
+def claimed_by_others(booknames):
+    # the books in booknames that other instances have live claims on
+    try:
+        claimfiles = set(os.listdir(os.path.join(_LOCS['SCAN_DIR'], CLAIM_DIR)))
+    except Exception:
+        return set()
+    now = time.time()
+    others = set()
+    for bookname in booknames:
+        if bookname + '.claim' in claimfiles:
+            owner, expiry = read_claim(claim_path(bookname))
+            if owner and owner != _OWNER and expiry > now:
+                others.add(bookname)
+    return others
+
+@lru_cache(maxsize=65536)
+def normalize_name(filename):
+    # (suggested name, warnings) for any file name, cached for the service
+    proposal = name_book(filename).proposal()
+    return proposal.name, proposal.name_warnings()
+
+def valid_filename(filename):
+    # a bare file name, so nothing from outside can point the service at other directories
+    return isinstance(filename, str) and filename not in ('', '.', '..') and \
+           os.path.basename(filename) == filename and '/' not in filename and '\\' not in filename
+
+def rename_book(bookname, newname=None, movebook=False, force=False):
+    '''the non-interactive version of finish, for the service. Renames a book in SCAN_DIR to
+    newname (or its suggested name), moving it to OUTPUT_DIR if movebook is set. Anything
+    check_title would ask about halts the rename unless force is set.
+    Returns (new file name, None) or (None, error message)'''
+    if not valid_filename(bookname) or (newname is not None and not valid_filename(newname)):
+        return None, 'file and name must be plain file names'
+    if not os.path.isfile(_LOCS['SCAN_DIR'] + bookname):
+        return None, 'no such book in SCAN_DIR'
+    if not claim_book(bookname):
+        return None, f'being worked on by {claim_owner(bookname)}'
+    try:
+        book = Book(_LOCS['SCAN_DIR'] + bookname)
+        guesses = [] # proposal warnings about an author it had to guess
+        if newname:
+            if book.ext and newname.lower().endswith(book.ext):
+                newname = newname[:-len(book.ext)]
+            book.seglist = split_name(newname)
+            book.reassemble_segs()
+        else:
+            book.apply_proposal()
+            guesses = [x for x in book.warnings if x == 'author guessed' or x.startswith('author could be')]
+
+        halts = [TAG_WORDS, TAG_BRACKETS]
+        if movebook:
+            halts += [TAG_RAR, TAG_LARGE]
+        if not force:
+            halts.append(TAG_AUTHOR)
+        problems = [x for x in book.policy_tags() if x in halts]
+        if not force:
+            problems += [f'author is usually "{known}"' for auth, known in book.author_mismatches()]
+            problems += guesses
+        if problems:
+            return None, 'halted: ' + ', '.join(problems)
+
+        newfilename = book.filename
+        while '  ' in newfilename:
+            newfilename = newfilename.replace('  ', ' ')
+        newpath = (_LOCS['OUTPUT_DIR'] if movebook else _LOCS['SCAN_DIR']) + newfilename
+        # the only thing allowed to be in the way is the book itself, e.g. a case-only rename
+        samefile = os.path.normcase(os.path.abspath(newpath)) == os.path.normcase(os.path.abspath(book.filepath))
+        if os.path.exists(newpath) and not samefile:
+            return None, f'{newfilename} already exists'
+        libmtime = dir_mtime(_LOCS['OUTPUT_DIR'])
+        try:
+            os.rename(book.filepath, newpath)
+        except Exception as err:
+            return None, f'error renaming book: {err}'
+        if movebook:
+            library_add(newfilename, libmtime)
+        if not guesses: # a forced guess shouldn't become the canonical form of a name
+            _AUTHORS.learn(split_authors(book.seglist[0]))
+        return newfilename, None
+    finally:
+        release_claim(bookname)
+
+def service_normalize(data):
+    results = []
+    for filename in data['names']:
+        try:
+            proposed, warnings = normalize_name(filename)
+        except Exception as err:
+            results.append({'name': filename, 'error': f'could not normalize name - {err}'})
+        else:
+            results.append({'name': filename, 'proposed': proposed, 'warnings': warnings})
+    return {'results': results}
+
+def service_dupes(data):
+    # searches on the suggested name if 'normalize' is set, otherwise the name as given
+    results = []
+    for filename in data['names']:
+        try:
+            seglist = split_name(normalize_name(filename)[0]) if data.get('normalize') else None
+            srchstr, matches = name_book(filename).find_dupes(seglist)
+        except Exception as err:
+            results.append({'name': filename, 'error': f'could not search for dupes - {err}'})
+        else:
+            results.append({'name': filename, 'search': srchstr.strip(' :'), 'matches': matches})
+    return {'results': results}
+
+def service_rename(job):
+    job['status'] = 'running'
+    try:
+        for item in job['renames']:
+            try:
+                newfilename, error = rename_book(item['file'], item.get('name'), bool(item.get('move')),
+                                                 bool(item.get('force')))
+            except Exception as err:
+                newfilename, error = None, f'error renaming book: {err}'
+            job['results'].append({'file': item['file'], 'newfile': newfilename, 'error': error})
+        _AUTHORS.save(_LOCS['AUTHOR_FILE']) # the service may well be stopped without a clean exit
+        save_library()
+    finally:
+        job['status'] = 'done'
+
+def check_rename(item):
+    # returns what's wrong with a rename request item, or None if it's fine
+    if not isinstance(item, dict) or 'file' not in item:
+        return 'each rename needs at least a "file"'
+    if not valid_filename(item['file']):
+        return f'"file" must be a plain file name in SCAN_DIR, not {item["file"]!r}'
+    if item.get('name') is not None and not valid_filename(item['name']):
+        return f'"name" must be a plain file name, not {item["name"]!r}'
+    for key in ('move', 'force'):
+        if item.get(key) is not None and not isinstance(item[key], bool):
+            return f'"{key}" must be true or false'
+    return None
+
+async def run_in_service(func, arg):
+    # runs blocking work on the executor, no more than SERVICE_WORKERS at a time
+    async with _SERVICE['limit']:
+        return await asyncio.get_running_loop().run_in_executor(None, func, arg)
+
+async def route_request(method, path, headers, body):
+    # returns (http status, json-able result)
+    if 'origin' in headers: # only a browser sends this, and no web page has any business here
+        return 403, {'error': 'cross-origin requests are not allowed'}
+    if method == 'GET' and path == '/status':
+        return 200, {'library': len(library_names()), 'authors': len(_AUTHORS),
+                     'jobs': {x['id']: x['status'] for x in _SERVICE['jobs'].values()}}
+    if method == 'GET' and path.startswith('/jobs/'):
+        job = _SERVICE['jobs'].get(path[6:])
+        return (200, job) if job else (404, {'error': 'no such job'})
+    if path not in ('/normalize', '/dupes', '/rename'):
+        return 404, {'error': f'unknown endpoint {path}'}
+    if method != 'POST':
+        return 405, {'error': f'{path} only accepts POST'}
+    if headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+        return 415, {'error': 'requests must be sent as application/json'}
+
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError as err:
+        return 400, {'error': f'invalid json - {err}'}
+    key = 'renames' if path == '/rename' else 'names'
+    if not isinstance(data, dict) or not isinstance(data.get(key), list):
+        return 400, {'error': f'expected a list of {key}'}
+    if len(data[key]) > MAX_BATCH:
+        return 413, {'error': f'batches are limited to {MAX_BATCH} {key}'}
+
+    if path == '/normalize':
+        return 200, await run_in_service(service_normalize, data)
+    if path == '/dupes':
+        return 200, await run_in_service(service_dupes, data)
+
+    for item in data['renames']:
+        problem = check_rename(item)
+        if problem:
+            return 400, {'error': problem}
+    jobid = str(_SERVICE['nextjob'])
+    _SERVICE['nextjob'] += 1
+    finished = [x for x in _SERVICE['jobs'] if _SERVICE['jobs'][x]['status'] == 'done']
+    for oldid in finished[:max(0, len(finished) - MAX_JOBS)]:
+        del _SERVICE['jobs'][oldid]
+    job = {'id': jobid, 'status': 'queued', 'renames': data['renames'], 'results': []}
+    _SERVICE['jobs'][jobid] = job
+    task = asyncio.create_task(run_in_service(service_rename, job))
+    _SERVICE['tasks'].add(task) # the loop only keeps a weak reference to running tasks
+    task.add_done_callback(_SERVICE['tasks'].discard)
+    return 202, {'job': jobid}
+
+async def handle_request(reader, writer):
+    try:
+        method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        body = await reader.readexactly(length) if length else b''
+    except Exception as err:
+        status, result = 400, {'error': f'bad request - {err}'}
+    else:
+        try:
+            status, result = await route_request(method, path.split('?')[0], headers, body)
+        except Exception as err:
+            print(f'Error handling {method} {path} - {err}')
+            status, result = 500, {'error': f'internal error - {err}'}
+
+    payload = json.dumps(result).encode('utf-8')
+    writer.write(f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n'
+                 f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+                 'Connection: close\r\n\r\n'.encode('latin-1') + payload)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def run_service(port):
+    _SERVICE['limit'] = asyncio.Semaphore(SERVICE_WORKERS)
+    server = await asyncio.start_server(handle_request, '127.0.0.1', port) # localhost only
+    async with server:
+        await server.serve_forever()
+
+def serve(port=SERVICE_PORT):
+    '''runs autoname as a local JSON service instead of the GUI, so other scripts can use the
+    naming rules and dupe check without a cold start. The library listing, author file and
+    suggested names stay loaded between calls. Endpoints:
+        POST /normalize {"names": [...]}            suggested names and warnings
+        POST /dupes {"names": [...], "normalize": bool}
+                                                    dupe search in OUTPUT_DIR
+        POST /rename {"renames": [{"file", "name", "move", "force"}, ...]}
+                                                    starts a rename job for books in SCAN_DIR
+        GET /jobs/<id>                              progress and results of a rename job
+        GET /status
+    POSTs must be sent as application/json, and anything with an Origin header (i.e. a web
+    page in a browser) is refused.'''
+    dir_loader() # load everything up front rather than on the first request
+    library_names()
+    print(f'Autoname service running on http://127.0.0.1:{port}/')
+    try:
+        asyncio.run(run_service(port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release_claims()
+        _AUTHORS.save(_LOCS['AUTHOR_FILE'])
+        save_library()
+
 def main():
     if not load_config():
         sys.exit(1)
+    _AUTHORS.load(_LOCS['AUTHOR_FILE'])
+    if '--serve' in sys.argv[1:]:
+        serve(_SERVICE['port'])
+        return
     start_preloader()
     booklist = gen_booklist()
     if booklist:
@@ -784,21 +1855,28 @@ def main():
         currbook = None
         process_events.currbook = None
     process_events.done = [0, len(booklist)]
+    process_events.completions = []
+    start_proposer(booklist)
+    start_screener(booklist)
     window = layout_window(booklist)
     window['txtdone'].Update(value=f'0/{process_events.done[1]}')
     display_currbook(window)
 
     while True:
-        event, values = window.Read()
+        event, values = window.Read(timeout=RENEW_SECS * 1000)
         #print(event, values)
         if event is None or event == 'Exit':
             break
-        elif event == '__TIMEOUT__':
-            pass
+        elif event == '__TIMEOUT__': # keep claims alive while the user is idle
+            renew_claims()
         else:
             process_events(window, event, values)
 
     window.Close()
+    release_claims()
+    _AUTHORS.save(_LOCS['AUTHOR_FILE'])
+    if _LIBRARY_READY.is_set():
+        save_library()
 
 if __name__ == '__main__':
     main()